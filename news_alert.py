@@ -1,7 +1,20 @@
-import os, json, time, datetime as dt, hashlib, re, requests, feedparser, html
+import os, json, datetime as dt, heapq, re, requests, html, xxhash
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
-from urllib.parse import quote_plus, urlparse, parse_qs, unquote
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote_plus, urlparse, parse_qs
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+import numpy as np
+
+try:
+    import orjson  # much faster state (de)serialization; stdlib json is the fallback
+except ImportError:
+    orjson = None
 
 # ================= CONFIG =================
 WATCHLIST = {
@@ -16,41 +29,161 @@ CLUSTER_COUNT = 3              # how many strong hits to alert
 ALERT_COOLDOWN_MIN = 120       # min gap between alerts per ticker
 POLL_NEWS_HOURS = 6            # how far back to query in Google News
 SENT_TTL_HOURS = 24            # do not re-send the same article within this TTL
+FETCH_WORKERS = 8              # concurrent Google News fetches
+POLL_BASE_SEC = 600            # poll interval at ~1 new item/hour (matches the cron cadence)
+POLL_MIN_SEC = 60              # fastest per-ticker poll interval
+POLL_MAX_SEC = 3600            # slowest per-ticker poll interval for quiet feeds
+POLL_RATE_ALPHA = 0.3          # EWMA weight of the latest new-items/hour sample
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
 STATE_PATH = Path("state.json")
+STATE_PRETTY = bool(os.getenv("STATE_PRETTY"))  # indent state.json for debugging
+SEEN_PATH = Path("seen.jsonl")  # append-only dedupe log backing state["seen_ids"]
+SEEN_COMPACT_RATIO = 2         # rewrite seen.jsonl once it holds this many lines per live record
 an = SentimentIntensityAnalyzer()
 
+# Shared by feed fetches and Telegram; pool sized so each fetch worker keeps its connection alive
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(16, FETCH_WORKERS),
+                                      max_retries=Retry(total=2, backoff_factor=0.3)))
+
 # ================= UTILITIES =================
-def now_ts(): return int(dt.datetime.utcnow().timestamp())
+def now_ts(): return int(dt.datetime.now(dt.timezone.utc).timestamp())
 
 def google_news_rss(query: str):
     q = quote_plus(query)  # encode spaces/quotes/$, etc.
     return f"https://news.google.com/rss/search?q={q}+when:{POLL_NEWS_HOURS}h&hl=en-US&gl=US&ceid=US:en"
 
-def senti(text: str): return an.polarity_scores((text or "")[:2000])["compound"]
+# Scores persisted across runs: {xxh3(text): [compound, last_used_ts]}, seeded from state["senti_cache"]
+_senti_disk = {}
+
+@lru_cache(maxsize=4096)
+def _senti_cached(text: str):
+    k = hkey(text)
+    hit = _senti_disk.get(k)
+    if hit:
+        hit[1] = now_ts()
+        return hit[0]
+    score = an.polarity_scores(text)["compound"]
+    _senti_disk[k] = [score, now_ts()]
+    return score
+
+def senti(text: str): return _senti_cached((text or "")[:2000])
 
-def get_pub_ts(entry):
-    for k in ("published_parsed", "updated_parsed"):
-        t = getattr(entry, k, None)
-        if t: return int(time.mktime(t))
-    return now_ts()
+def senti_many(texts):
+    """
+    Score a batch of texts in one pass: each unique text is hashed once, looked
+    up in (or scored into) the persisted cache, then mapped back in order.
+    """
+    texts = [(t or "")[:2000] for t in texts]
+    ts = now_ts()
+    scores = {}
+    for t in dict.fromkeys(texts):
+        k = hkey(t)
+        hit = _senti_disk.get(k)
+        if hit:
+            hit[1] = ts
+        else:
+            hit = _senti_disk[k] = [an.polarity_scores(t)["compound"], ts]
+        scores[t] = hit[0]
+    return [scores[t] for t in texts]
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+def _prep(title: str, summary: str) -> str:
+    # Google News descriptions are HTML snippets; score plain text only, once per entry
+    s = summary and html.unescape(_TAG_RE.sub(" ", summary)).strip()
+    return (f"{title} {s}" if s else title)[:2000]
+
+def get_pub_ts(pub_date: str):
+    try:
+        d = parsedate_to_datetime(pub_date)
+    except (TypeError, ValueError):
+        return now_ts()
+    if d.tzinfo is None: d = d.replace(tzinfo=dt.timezone.utc)
+    return int(d.timestamp())
 
 def load_state():
+    state = None
     if STATE_PATH.exists():
         try:
-            return json.loads(STATE_PATH.read_text())
+            raw = STATE_PATH.read_bytes()
+            state = orjson.loads(raw) if orjson else json.loads(raw)
+            state["sent_ids"] = _int_keys(state.get("sent_ids", {}))
+            state["senti_cache"] = _int_keys(state.get("senti_cache", {}))
         except Exception:
-            pass
-    # seen_ids: {ticker: {sha1(canonical_url): pub_ts}}
+            state = None
+    # seen_ids: {ticker: {xxh3(canonical_url): pub_ts}}, loaded from seen.jsonl
     # last_alert: {ticker: ts}
-    # sent_ids: {sha1(canonical_url): last_sent_ts}
-    return {"seen_ids": {}, "last_alert": {}, "sent_ids": {}}
-
-def save_state(state): STATE_PATH.write_text(json.dumps(state, indent=2))
-
+    # sent_ids: {xxh3(canonical_url): last_sent_ts}
+    # senti_cache: {xxh3(text): [compound, last_used_ts]}
+    # feed_meta: {ticker: {"etag", "modified", "items": scored in-window items replayed on 304}}
+    # poll_meta: {ticker: {"last_fetch_ts", "new_item_rate": EWMA of new items/hour}}
+    if state is None:
+        state = {"last_alert": {}, "sent_ids": {}, "senti_cache": {}, "feed_meta": {}, "poll_meta": {}}
+    state["seen_ids"] = load_seen()
+    return state
+
+def save_state(state):
+    # seen_ids lives in seen.jsonl (see append_seen)
+    state = {k: v for k, v in state.items() if k != "seen_ids"}
+    if orjson:
+        opt = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if STATE_PRETTY else 0)
+        STATE_PATH.write_bytes(orjson.dumps(state, option=opt))
+    elif STATE_PRETTY:
+        STATE_PATH.write_text(json.dumps(state, indent=2, sort_keys=True))
+    else:
+        STATE_PATH.write_text(json.dumps(state, separators=(",", ":")))
+
+def _seen_line(tkr, h, pub_ts) -> bytes:
+    rec = {"t": tkr, "h": h, "p": pub_ts}
+    return (orjson.dumps(rec) if orjson else json.dumps(rec, separators=(",", ":")).encode()) + b"\n"
+
+# Lines currently in seen.jsonl (live, stale and torn), tracked to decide compaction
+_seen_lines = 0
+
+def load_seen():
+    # One {"t": ticker, "h": hkey(url), "p": pub_ts} record per line; later lines win
+    global _seen_lines
+    seen = {}
+    _seen_lines = 0
+    if not SEEN_PATH.exists(): return seen
+    with SEEN_PATH.open("rb") as f:
+        for line in f:
+            _seen_lines += 1
+            try:
+                rec = orjson.loads(line) if orjson else json.loads(line)
+                seen.setdefault(rec["t"], {})[rec["h"]] = rec["p"]
+            except (ValueError, KeyError, TypeError):
+                continue  # torn or foreign line
+    return seen
+
+def append_seen(records, seen):
+    """
+    Append new (ticker, hkey, pub_ts) records to seen.jsonl. Once the file holds
+    more than SEEN_COMPACT_RATIO lines per live record (stale entries pruned from
+    `seen` accumulate on disk), it is rewritten from the live map instead.
+    """
+    global _seen_lines
+    live = sum(len(d) for d in seen.values())
+    if _seen_lines + len(records) > SEEN_COMPACT_RATIO * live:
+        tmp = SEEN_PATH.with_suffix(".jsonl.tmp")
+        tmp.write_bytes(b"".join(_seen_line(t, h, p) for t, d in seen.items() for h, p in d.items()))
+        tmp.replace(SEEN_PATH)
+        _seen_lines = live
+    elif records:
+        with SEEN_PATH.open("ab+") as f:
+            # A crash mid-append leaves a torn last line; terminate it so it's the only line lost
+            lead = b""
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n": lead = b"\n"
+            f.write(lead + b"".join(_seen_line(t, h, p) for t, h, p in records))
+        _seen_lines += len(records)
+
+@lru_cache(maxsize=2048)
 def extract_canonical_url(u: str) -> str:
     """
     Unwrap Google News redirect URLs to their canonical target.
@@ -60,11 +193,12 @@ def extract_canonical_url(u: str) -> str:
         if parsed.netloc.endswith("news.google.com"):
             qs = parse_qs(parsed.query)
             if "url" in qs and qs["url"]:
-                return unquote(qs["url"][0])
+                return qs["url"][0]  # parse_qs already percent-decodes
         return u
     except Exception:
         return u
 
+@lru_cache(maxsize=2048)
 def domain_from_url(u: str) -> str:
     try:
         parsed = urlparse(u)
@@ -74,6 +208,10 @@ def domain_from_url(u: str) -> str:
     except Exception:
         return ""
 
+def next_poll_interval(rate: float) -> int:
+    # Quiet feeds back off toward POLL_MAX_SEC, busy ones are polled every run
+    return int(max(POLL_MIN_SEC, min(POLL_MAX_SEC, POLL_BASE_SEC / max(rate, 0.1))))
+
 def human_ago(ts: int):
     delta = now_ts() - ts
     if delta < 60: return f"{delta}s ago"
@@ -82,8 +220,13 @@ def human_ago(ts: int):
     hours = minutes // 60
     return f"{hours}h {minutes%60}m ago"
 
-def hsha(u: str) -> str:
-    return hashlib.sha1(u.encode("utf-8", "ignore")).hexdigest()
+def hkey(u: str) -> int:
+    # 64-bit non-cryptographic hash; only used as a dedupe key
+    return xxhash.xxh3_64_intdigest(u.encode("utf-8", "ignore"))
+
+def _int_keys(d):
+    # JSON stores hkey() keys as strings; legacy sha1 hex keys are dropped
+    return {int(k): v for k, v in d.items() if k.isdigit()}
 
 # Credibility weights (tweak as you like)
 CRED_WEIGHTS = {
@@ -95,16 +238,37 @@ CRED_WEIGHTS = {
     "marketbeat.com": 1.0,
 }
 DEFAULT_WEIGHT = 1.0
-def source_weight(u: str): return CRED_WEIGHTS.get(domain_from_url(u), DEFAULT_WEIGHT)
 
-def weighted_sum(hits):
-    return sum(h["score"] * source_weight(h["url"]) for h in hits)
-
-def cluster_confidence(hits, window_min):
-    if not hits: return "Low"
-    vol = len(hits)
-    avg_abs = sum(abs(h["score"]) for h in hits)/vol
-    avg_w = sum(source_weight(h["url"]) for h in hits)/vol
+def _partition(items, cutoff_ts):
+    """
+    Mask the items published since `cutoff_ts` into strong positive/negative
+    index arrays plus every aggregate the gate, signature and alert text need.
+    """
+    idx = np.flatnonzero(items.pub_ts >= cutoff_ts)
+    sc = items.scores[idx]
+    w = items.weights[idx]
+    pos_mask = sc >= STRONG_POS
+    neg_mask = sc <= STRONG_NEG
+    stats = {"total": len(idx), "pos_count": int(np.count_nonzero(sc > 0)),
+             "net": float(sc.sum()), "wsum": float(sc @ w),
+             "sources": len({items.domains[i] for i in idx if items.urls[i]}),
+             "abs_sum": float(np.abs(sc).sum()), "w_sum": float(w.sum()),
+             "pos_sum": float(sc[pos_mask].sum()), "neg_sum": float(sc[neg_mask].sum())}
+    return idx[pos_mask], idx[neg_mask], stats
+
+def _side_top(items, pos, neg, stats, k=5):
+    # Dominant side by summed score; its k strongest hits as indices, strongest first
+    side_idx = pos if stats["pos_sum"] >= abs(stats["neg_sum"]) else neg
+    sc = items.scores[side_idx].tolist()
+    bullish = bool(sc) and sc[0] > 0
+    pick = heapq.nlargest if bullish else heapq.nsmallest
+    return ("Bullish" if bullish else "Bearish"), [side_idx[j] for j in pick(k, range(len(sc)), key=sc.__getitem__)]
+
+def cluster_confidence(stats, window_min):
+    if not stats["total"]: return "Low"
+    vol = stats["total"]
+    avg_abs = stats["abs_sum"]/vol
+    avg_w = stats["w_sum"]/vol
     recency = max(0.5, min(1.0, 180 / max(1, window_min)))  # decay if you widen the window
     raw = vol * avg_abs * avg_w * recency
     if raw >= 4.0: return "High"
@@ -129,44 +293,87 @@ def notify_telegram_html(text_html: str):
         "disable_web_page_preview": True
     }
     try:
-        requests.post(url, json=payload, timeout=15)
+        SESSION.post(url, json=payload, timeout=15)
     except Exception as e:
         print("Telegram error:", e)
 
 # ================= FETCH =================
-def fetch_items(ticker, name):
+@dataclass
+class Items:
+    """
+    Struct-of-arrays view of one ticker's scored items, newest first. Domain and
+    credibility weight are resolved once here, for fetched and replayed items alike.
+    """
+    titles: list
+    urls: list            # canonical URLs
+    domains: list
+    scores: np.ndarray    # float64 VADER compound
+    pub_ts: np.ndarray    # int64 epoch seconds
+    weights: np.ndarray   # float64 CRED_WEIGHTS of each domain
+
+    @classmethod
+    def from_dicts(cls, items):
+        urls = [it["url"] for it in items]
+        domains = [domain_from_url(u) for u in urls]
+        return cls([it["title"] for it in items], urls, domains,
+                   np.fromiter((it["score"] for it in items), dtype=np.float64, count=len(items)),
+                   np.fromiter((it["pub_ts"] for it in items), dtype=np.int64, count=len(items)),
+                   np.fromiter((CRED_WEIGHTS.get(d, DEFAULT_WEIGHT) for d in domains),
+                               dtype=np.float64, count=len(domains)))
+
+def fetch_items(ticker, name, meta):
+    """
+    Fetch a ticker's feed with a conditional GET. On 304 the scored in-window
+    items cached in `meta` (written by run_once) are replayed; otherwise the
+    validators in `meta` are refreshed in place and unscored items returned.
+    Returns None if the fetch or parse fails, leaving `meta` untouched.
+    """
     q = f'"{name}" OR {ticker} OR ${ticker}'
-    feed = feedparser.parse(google_news_rss(q))
+    headers = {}
+    if meta.get("etag"): headers["If-None-Match"] = meta["etag"]
+    if meta.get("modified"): headers["If-Modified-Since"] = meta["modified"]
+    try:
+        resp = SESSION.get(google_news_rss(q), headers=headers, timeout=15)
+        if resp.status_code == 304:
+            return [dict(it) for it in meta.get("items", [])]
+        resp.raise_for_status()
+    except Exception as e:
+        print(f"Fetch error for {ticker}:", e)
+        return None
+    try:
+        # parsers are not thread-safe, so build one per fetch; never resolve external entities
+        parser = etree.XMLParser(resolve_entities=False, no_network=True, recover=True)
+        root = etree.fromstring(resp.content, parser)
+    except etree.XMLSyntaxError as e:
+        print(f"Feed parse error for {ticker}:", e)
+        return None
     items = []
-    for e in feed.entries:
-        title = getattr(e, "title", "")
-        summary = getattr(e, "summary", "")
-        link = getattr(e, "link", "")
+    for e in (root.iterfind(".//item") if root is not None else ()):
+        title = (e.findtext("title") or "").strip()
+        summary = e.findtext("description") or ""
+        link = (e.findtext("link") or "").strip()
         can_url = extract_canonical_url(link)
-        score = senti(f"{title} {summary}")
         items.append({
-            "title": title, "url": can_url, "score": score, "pub_ts": get_pub_ts(e)
+            "title": title, "url": can_url, "text": _prep(title, summary), "pub_ts": get_pub_ts(e.findtext("pubDate"))
         })
     # newest first
     items.sort(key=lambda x: x["pub_ts"], reverse=True)
+    meta["etag"] = resp.headers.get("ETag")
+    meta["modified"] = resp.headers.get("Last-Modified")
     return items
 
 # ================= ALERT FORMAT =================
-def format_alert_html(ticker, window_min, window_hits):
-    # Partition into pos/neg for stats
-    pos_hits = [h for h in window_hits if h["score"] >= STRONG_POS]
-    neg_hits = [h for h in window_hits if h["score"] <= STRONG_NEG]
-    side_hits = pos_hits if sum(h["score"] for h in pos_hits) >= abs(sum(h["score"] for h in neg_hits)) else neg_hits
-    side = "Bullish" if side_hits and side_hits[0]["score"] > 0 else "Bearish"
-    side_sorted = sorted(side_hits, key=lambda x: x["score"], reverse=True) if side == "Bullish" \
-                  else sorted(side_hits, key=lambda x: x["score"])
-
-    total = len(window_hits)
-    pos_count = sum(1 for h in window_hits if h["score"] > 0)
-    net = sum(h["score"] for h in window_hits)
-    wsum = weighted_sum(window_hits)
-    sources = len({domain_from_url(h["url"]) for h in window_hits if h["url"]})
-    conf = cluster_confidence(window_hits, window_min)
+def format_alert_html(ticker, window_min, items, part):
+    # part is _partition(items, cutoff_ts): (pos_idx, neg_idx, stats)
+    pos_idx, neg_idx, stats = part
+    side, side_top = _side_top(items, pos_idx, neg_idx, stats)
+
+    total = stats["total"]
+    pos_count = stats["pos_count"]
+    net = stats["net"]
+    wsum = stats["wsum"]
+    sources = stats["sources"]
+    conf = cluster_confidence(stats, window_min)
 
     lines = []
     lines.append(f"<b>{t_escape(ticker)}</b> — {t_escape(side)} cluster (last {window_min}m)")
@@ -174,85 +381,131 @@ def format_alert_html(ticker, window_min, window_hits):
     lines.append("")
     lines.append("<b>Top headlines:</b>")
 
-    for i, h in enumerate(side_sorted[:5], 1):
-        dom = domain_from_url(h["url"])
-        ago = human_ago(h["pub_ts"])
-        title = t_escape(h["title"])
-        link = t_escape(h["url"])
-        lines.append(f"{i}) {title} — {t_escape(dom)} ({h['score']:+.2f}, {t_escape(ago)}) <a href=\"{link}\">open</a>")
+    for n, i in enumerate(side_top, 1):
+        dom = items.domains[i]
+        ago = human_ago(int(items.pub_ts[i]))
+        title = t_escape(items.titles[i])
+        link = t_escape(items.urls[i])
+        lines.append(f"{n}) {title} — {t_escape(dom)} ({items.scores[i]:+.2f}, {t_escape(ago)}) <a href=\"{link}\">open</a>")
 
     # Counterpoint (strongest on the other side)
-    opp = neg_hits if side == "Bullish" else pos_hits
-    if opp:
-        opp_pick = sorted(opp, key=lambda x: -abs(x["score"]))[0]
-        dom = domain_from_url(opp_pick["url"])
-        ago = human_ago(opp_pick["pub_ts"])
-        title = t_escape(opp_pick["title"])
-        link = t_escape(opp_pick["url"])
+    opp = neg_idx if side == "Bullish" else pos_idx
+    if len(opp):
+        i = opp[np.argmax(np.abs(items.scores[opp]))]
+        dom = items.domains[i]
+        ago = human_ago(int(items.pub_ts[i]))
+        title = t_escape(items.titles[i])
+        link = t_escape(items.urls[i])
         lines.append("")
         lines.append("<i>Counterpoint:</i>")
-        lines.append(f"• {title} — {t_escape(dom)} ({opp_pick['score']:+.2f}, {t_escape(ago)}) <a href=\"{link}\">open</a>")
+        lines.append(f"• {title} — {t_escape(dom)} ({items.scores[i]:+.2f}, {t_escape(ago)}) <a href=\"{link}\">open</a>")
 
     return "\n".join(lines)
 
 # ================= MAIN =================
 def run_once():
     state = load_state()
-    cutoff_ts = now_ts() - LOOKBACK_MIN * 60
-    sent_ttl_cutoff = now_ts() - SENT_TTL_HOURS * 3600
+    # One clock read per run: the poll due-check and last_fetch_ts stamp must agree,
+    # otherwise fetch time shaves the next gap below POLL_BASE_SEC and skips a cron tick
+    now = now_ts()
+    cutoff_ts = now - LOOKBACK_MIN * 60
+    sent_ttl_cutoff = now - SENT_TTL_HOURS * 3600
     # prune old sent_ids
     state["sent_ids"] = {k:v for k,v in state.get("sent_ids", {}).items() if v >= sent_ttl_cutoff}
+    # prune seen_ids to twice the longest window we care about so state stays bounded
+    seen_horizon = now - max(LOOKBACK_MIN * 60, SENT_TTL_HOURS * 3600) * 2
+    state["seen_ids"] = {tkr: {h:ts for h,ts in d.items() if ts >= seen_horizon}
+                         for tkr, d in state.get("seen_ids", {}).items()}
+    # prune stale sentiment scores and share the dict with senti() so new scores get persisted
+    _senti_disk.clear()
+    _senti_disk.update({k:v for k,v in state.get("senti_cache", {}).items() if v[1] >= sent_ttl_cutoff})
+    state["senti_cache"] = _senti_disk
 
     changed = False
+    new_seen = []
+
+    # Tickers inside their alert cooldown can't alert, so skip their fetch and scoring entirely
+    active = [tkr for tkr in WATCHLIST
+              if now - state["last_alert"].get(tkr, 0) >= ALERT_COOLDOWN_MIN * 60]
+
+    # Fetch due tickers concurrently, then score all headlines in a single batch.
+    # Tickers inside their backoff interval, or whose fetch failed, replay their cached window items.
+    feed_meta = state.setdefault("feed_meta", {})
+    poll_meta = state.setdefault("poll_meta", {})
+    # POLL_MIN_SEC of slack absorbs cron start jitter so a due ticker isn't pushed a whole tick
+    due = [tkr for tkr in active
+           if now - poll_meta.get(tkr, {}).get("last_fetch_ts", 0)
+              >= next_poll_interval(poll_meta.get(tkr, {}).get("new_item_rate", 1.0)) - POLL_MIN_SEC]
+    metas = [feed_meta.setdefault(tkr, {}) for tkr in due]
+    meta_before = [dict(m) for m in metas]
+    with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(due)))) as ex:
+        fetched = dict(zip(due, ex.map(fetch_items, due, [WATCHLIST[t] for t in due], metas)))
+    # Failed fetches (None) replay the cache too and don't count as a poll
+    fetched = {tkr: raw for tkr, raw in fetched.items() if raw is not None}
+    results = {tkr: fetched[tkr] if tkr in fetched else [dict(it) for it in feed_meta.get(tkr, {}).get("items", [])]
+               for tkr in active}
+    # Replayed items are already scored; only freshly fetched ones need VADER
+    unscored = [it for raw in results.values() for it in raw if "score" not in it]
+    for it, score in zip(unscored, senti_many([it.get("text", it["title"]) for it in unscored])):
+        it["score"] = score
+    # Cache just what replay needs, so state.json doesn't carry the scoring text
+    for tkr, raw in fetched.items():
+        feed_meta[tkr]["items"] = [{"title": it["title"], "url": it["url"], "pub_ts": it["pub_ts"], "score": it["score"]}
+                                   for it in raw if it["pub_ts"] >= cutoff_ts]
+    # Persist refreshed validators/items even when no item is new, or conditional GET never kicks in
+    if any(m != b for m, b in zip(metas, meta_before)):
+        changed = True
 
-    for tkr, name in WATCHLIST.items():
+    for tkr, raw in results.items():
+        items = Items.from_dicts(raw)
         seen = state["seen_ids"].setdefault(tkr, {})
-        items = fetch_items(tkr, name)
 
-        # Build window and dedupe by canonical URL hash
-        window_hits = []
-        for it in items:
-            can = it["url"]
-            h = hsha(can)
+        # Dedupe by canonical URL hash
+        new_count = 0
+        for u, ts in zip(items.urls, items.pub_ts.tolist()):
+            h = hkey(u)
             if h not in seen:
-                seen[h] = it["pub_ts"]
-                changed = True
-            if it["pub_ts"] >= cutoff_ts:
-                window_hits.append(it)
+                seen[h] = ts
+                new_seen.append((tkr, h, ts))
+                new_count += 1
+
+        # Track how busy the feed is to pace future polls
+        if tkr in fetched:
+            pm = poll_meta.setdefault(tkr, {})
+            hours = max(now - pm.get("last_fetch_ts", now - POLL_BASE_SEC), 60) / 3600
+            prev = pm.get("new_item_rate")
+            rate = new_count / hours
+            pm["new_item_rate"] = rate if prev is None else POLL_RATE_ALPHA * rate + (1 - POLL_RATE_ALPHA) * prev
+            pm["last_fetch_ts"] = now
+            changed = True
 
         # Gate: need enough strong hits either side to consider alerting
-        pos = [x for x in window_hits if x["score"] >= STRONG_POS]
-        neg = [x for x in window_hits if x["score"] <= STRONG_NEG]
+        part = _partition(items, cutoff_ts)
+        pos, neg, stats = part
         if not (len(pos) >= CLUSTER_COUNT or len(neg) >= CLUSTER_COUNT):
             continue
 
         # Prevent re-sending if we've just pushed the same top links
         # Build a signature of top items (by score, 5 max)
-        side_hits = pos if sum(h["score"] for h in pos) >= abs(sum(h["score"] for h in neg)) else neg
-        side_sorted = sorted(side_hits, key=lambda x: x["score"], reverse=True) if side_hits and side_hits[0]["score"] > 0 else \
-                      sorted(side_hits, key=lambda x: x["score"])
-        top_urls = [h["url"] for h in side_sorted[:5]]
-        sig = hsha("|".join(top_urls))
+        _, side_top = _side_top(items, pos, neg, stats)
+        top_urls = [items.urls[i] for i in side_top]
+        sig = hkey("|".join(top_urls))
 
         last_sent = state["sent_ids"].get(sig, 0)
-        if now_ts() - last_sent < ALERT_COOLDOWN_MIN * 60:
+        if now - last_sent < ALERT_COOLDOWN_MIN * 60:
             # skip duplicate-ish alert within cooldown
             continue
 
-        # Cooldown per ticker
-        last_tkr = state["last_alert"].get(tkr, 0)
-        if now_ts() - last_tkr < ALERT_COOLDOWN_MIN * 60:
-            continue
-
         # Send formatted HTML alert
-        msg_html = format_alert_html(tkr, LOOKBACK_MIN, window_hits)
+        msg_html = format_alert_html(tkr, LOOKBACK_MIN, items, part)
         notify_telegram_html(msg_html)
 
         # Update alert timestamps/signature cache
-        state["last_alert"][tkr] = now_ts()
-        state["sent_ids"][sig] = now_ts()
+        state["last_alert"][tkr] = now
+        state["sent_ids"][sig] = now
         changed = True
 
+    append_seen(new_seen, state["seen_ids"])
     if changed:
         save_state(state)
 